@@ -0,0 +1,51 @@
+-- /models/trending 用の集計関数
+-- model_id ごとに期間内の最古/最新スナップショットの likes 差分を DB 側で計算し、
+-- 上位 p_limit 件のみを返す（全スナップショット行を API 側へ転送しない）
+CREATE OR REPLACE FUNCTION trending_models(
+  p_days INTEGER,
+  p_tag TEXT DEFAULT NULL,
+  p_limit INTEGER DEFAULT 20
+)
+RETURNS TABLE (
+  model_id TEXT,
+  pipeline_tag TEXT,
+  likes_latest INTEGER,
+  likes_delta INTEGER,
+  snapshot_date_from DATE,
+  snapshot_date_to DATE
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH windowed AS (
+    SELECT
+      s.model_id,
+      count(*) OVER w AS n_snapshots,
+      row_number() OVER (PARTITION BY s.model_id ORDER BY s.snapshot_date DESC) AS rn,
+      first_value(s.likes) OVER w AS likes_oldest,
+      last_value(s.likes) OVER w AS likes_latest,
+      last_value(s.pipeline_tag) OVER w AS pipeline_tag,
+      first_value(s.snapshot_date) OVER w AS snapshot_date_from,
+      last_value(s.snapshot_date) OVER w AS snapshot_date_to
+    FROM model_snapshots s
+    WHERE s.snapshot_date >= CURRENT_DATE - p_days
+      AND (p_tag IS NULL OR s.pipeline_tag = p_tag)
+    WINDOW w AS (
+      PARTITION BY s.model_id
+      ORDER BY s.snapshot_date
+      ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+  )
+  SELECT
+    model_id,
+    pipeline_tag,
+    likes_latest,
+    COALESCE(likes_latest, 0) - COALESCE(likes_oldest, 0) AS likes_delta,
+    snapshot_date_from,
+    snapshot_date_to
+  FROM windowed
+  -- 差分計算には 2 件以上のスナップショットが必要
+  WHERE rn = 1 AND n_snapshots >= 2
+  ORDER BY likes_delta DESC
+  LIMIT p_limit;
+$$;
@@ -0,0 +1,7 @@
+-- /models/{model_id}/history 用のカバリングインデックス
+-- 取得カラムを INCLUDE し、model_id 絞り込み + snapshot_date 降順 + LIMIT を
+-- テーブル本体を読まない index-only scan で完結させる
+-- CONCURRENTLY はトランザクション内で実行できないため、このファイルは単一文のみとする
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_snapshots_model_date
+  ON model_snapshots (model_id, snapshot_date DESC)
+  INCLUDE (downloads_30d, likes, pipeline_tag, tags);
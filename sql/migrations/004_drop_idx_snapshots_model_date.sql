@@ -0,0 +1,3 @@
+-- 003 の ix_snapshots_model_date と同一キーの旧インデックスを削除（書き込み時の二重更新を避ける）
+-- 003 の適用完了後に実行すること
+DROP INDEX CONCURRENTLY IF EXISTS idx_snapshots_model_date;
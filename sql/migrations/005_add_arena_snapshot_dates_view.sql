@@ -0,0 +1,5 @@
+-- arena_rankings のインポート済み snapshot_date 一覧（1 日付 1 行）
+-- crawl_arena.py が HF Space 上の pkl 日付のインポート有無を 1 リクエストで判定するために使う
+CREATE OR REPLACE VIEW arena_snapshot_dates AS
+  SELECT DISTINCT snapshot_date
+  FROM arena_rankings;
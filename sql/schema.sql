@@ -46,12 +46,69 @@ CREATE TABLE IF NOT EXISTS arena_rankings (
   UNIQUE (snapshot_date, model_name)
 );
 
--- 成長率計算用インデックス（クエリ高速化）
-CREATE INDEX IF NOT EXISTS idx_snapshots_model_date
-  ON model_snapshots (model_id, snapshot_date DESC);
+-- インポート済みの Arena snapshot_date 一覧（crawl_arena.py の重複インポート判定用）
+CREATE OR REPLACE VIEW arena_snapshot_dates AS
+  SELECT DISTINCT snapshot_date
+  FROM arena_rankings;
+
+-- 成長率計算・履歴取得用インデックス（クエリ高速化）
+-- /models/{model_id}/history の取得カラムを INCLUDE し index-only scan で完結させる
+CREATE INDEX IF NOT EXISTS ix_snapshots_model_date
+  ON model_snapshots (model_id, snapshot_date DESC)
+  INCLUDE (downloads_30d, likes, pipeline_tag, tags);
 
 CREATE INDEX IF NOT EXISTS idx_snapshots_date
   ON model_snapshots (snapshot_date DESC);
 
 CREATE INDEX IF NOT EXISTS idx_models_pipeline
   ON models (pipeline_tag);
+
+-- /models/trending 用の集計関数（likes 増分上位を DB 側で計算）
+CREATE OR REPLACE FUNCTION trending_models(
+  p_days INTEGER,
+  p_tag TEXT DEFAULT NULL,
+  p_limit INTEGER DEFAULT 20
+)
+RETURNS TABLE (
+  model_id TEXT,
+  pipeline_tag TEXT,
+  likes_latest INTEGER,
+  likes_delta INTEGER,
+  snapshot_date_from DATE,
+  snapshot_date_to DATE
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH windowed AS (
+    SELECT
+      s.model_id,
+      count(*) OVER w AS n_snapshots,
+      row_number() OVER (PARTITION BY s.model_id ORDER BY s.snapshot_date DESC) AS rn,
+      first_value(s.likes) OVER w AS likes_oldest,
+      last_value(s.likes) OVER w AS likes_latest,
+      last_value(s.pipeline_tag) OVER w AS pipeline_tag,
+      first_value(s.snapshot_date) OVER w AS snapshot_date_from,
+      last_value(s.snapshot_date) OVER w AS snapshot_date_to
+    FROM model_snapshots s
+    WHERE s.snapshot_date >= CURRENT_DATE - p_days
+      AND (p_tag IS NULL OR s.pipeline_tag = p_tag)
+    WINDOW w AS (
+      PARTITION BY s.model_id
+      ORDER BY s.snapshot_date
+      ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+  )
+  SELECT
+    model_id,
+    pipeline_tag,
+    likes_latest,
+    COALESCE(likes_latest, 0) - COALESCE(likes_oldest, 0) AS likes_delta,
+    snapshot_date_from,
+    snapshot_date_to
+  FROM windowed
+  -- 差分計算には 2 件以上のスナップショットが必要
+  WHERE rn = 1 AND n_snapshots >= 2
+  ORDER BY likes_delta DESC
+  LIMIT p_limit;
+$$;
@@ -8,28 +8,32 @@ Endpoints:
   GET /models/{model_id}/history - Snapshot history for a specific model
 """
 
-from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import date, timedelta
 from typing import Optional
 
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi_cache.decorator import cache
 
-from config import TARGET_PIPELINE_TAGS, LIMIT_PER_TAG
-from db import get_supabase
+from db import get_async_supabase
+from response_cache import MODELS_CACHE_EXPIRE, MODELS_NAMESPACE, init_cache, query_key_builder
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_cache()
+    yield
 
-# crawl_hf.py の LIMIT_PER_TAG に合わせた上限 + バッファ（クロール上限超えのモデルも拾う）
-_MODELS_PER_TAG = LIMIT_PER_TAG + 50
-# config.py の TARGET_PIPELINE_TAGS から自動計算（手動同期不要）
-_N_PIPELINE_TAGS = len(TARGET_PIPELINE_TAGS)
-# LIMIT_PER_TAG(200) × N_PIPELINE_TAGS(4) × days(25) 相当の絶対上限
-# 上限超えは trending 精度の低下と引き換えに DB 負荷を抑制する
-_ROW_CAP_MAX = 20_000
 
 app = FastAPI(
     title="HuggingFace Daily Insights API",
     description="Daily insights on HuggingFace models, arXiv papers, and LMArena rankings with historical time-series data",
     version="0.1.0",
+    lifespan=lifespan,
+    # 一覧系レスポンス（list[dict]）の JSON 化を orjson で行う
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -41,12 +45,13 @@ app.add_middleware(
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 @app.get("/models/trending")
-def get_trending(
+@cache(expire=MODELS_CACHE_EXPIRE, namespace=MODELS_NAMESPACE, key_builder=query_key_builder)
+async def get_trending(
     pipeline_tag: Optional[str] = Query(None, description="Filter by task type e.g. text-generation"),
     days: int = Query(7, ge=1, le=90, description="Lookback window in days"),
     limit: int = Query(20, ge=1, le=100, description="Max results"),
@@ -55,57 +60,24 @@ def get_trending(
     Return models ranked by likes increase over the past N days.
     Requires at least two snapshots (today and N days ago) to compute delta.
     """
-    sb = get_supabase()
-
-    cutoff = (date.today() - timedelta(days=days)).isoformat()
-    # pipeline_tag 指定なし = 全タグが対象。タグ数分のモデルを見込んで行数上限を設定
-    # days × (1タグのモデル数上限) × (対象タグ数) でウィンドウ内の全スナップを取得できる
-    tag_multiplier = 1 if pipeline_tag else _N_PIPELINE_TAGS
-    row_cap = min(days * _MODELS_PER_TAG * tag_multiplier, _ROW_CAP_MAX)
-
-    query = (
-        sb.table("model_snapshots")
-        .select("model_id, snapshot_date, likes, pipeline_tag")
-        .gte("snapshot_date", cutoff)
-        .order("snapshot_date", desc=False)
-        .limit(row_cap)
-    )
-    if pipeline_tag:
-        query = query.eq("pipeline_tag", pipeline_tag)
+    sb = await get_async_supabase()
 
+    # likes 増分（最新 - 最古）の集計と上位 limit 件の抽出は DB 関数 trending_models で行う
+    # （sql/migrations/002_add_trending_models_function.sql）
     try:
-        resp = query.execute()
+        resp = await sb.rpc(
+            "trending_models",
+            # 空文字列は他エンドポイントの `if pipeline_tag:` と同様に「全タグ」として扱う
+            {"p_days": days, "p_tag": pipeline_tag or None, "p_limit": limit},
+        ).execute()
     except Exception as e:
         raise HTTPException(status_code=503, detail="Database unavailable") from e
-    rows = resp.data
-
-    # model_id ごとにスナップショットをまとめて likes の増分（最新 - 最古）を計算
-    model_snapshots: dict[str, list] = defaultdict(list)
-    for row in rows:
-        model_snapshots[row["model_id"]].append(row)
-
-    deltas = []
-    for model_id, snaps in model_snapshots.items():
-        if len(snaps) < 2:
-            continue
-        oldest = snaps[0]
-        latest = snaps[-1]
-        delta = (latest["likes"] or 0) - (oldest["likes"] or 0)
-        deltas.append({
-            "model_id": model_id,
-            "pipeline_tag": latest.get("pipeline_tag"),
-            "likes_latest": latest["likes"],
-            "likes_delta": delta,
-            "snapshot_date_from": oldest["snapshot_date"],
-            "snapshot_date_to": latest["snapshot_date"],
-        })
-
-    deltas.sort(key=lambda x: x["likes_delta"], reverse=True)
-    return deltas[:limit]
+    return resp.data
 
 
 @app.get("/models/new")
-def get_new(
+@cache(expire=MODELS_CACHE_EXPIRE, namespace=MODELS_NAMESPACE, key_builder=query_key_builder)
+async def get_new(
     pipeline_tag: Optional[str] = Query(None, description="Filter by task type"),
     days: int = Query(7, ge=1, le=90, description="Lookback window in days"),
     limit: int = Query(20, ge=1, le=100, description="Max results"),
@@ -115,7 +87,7 @@ def get_new(
     """
     cutoff = (date.today() - timedelta(days=days)).isoformat()
 
-    sb = get_supabase()
+    sb = await get_async_supabase()
     query = (
         sb.table("models")
         .select("id, name, author, pipeline_tag, first_seen_at")
@@ -127,14 +99,14 @@ def get_new(
         query = query.eq("pipeline_tag", pipeline_tag)
 
     try:
-        resp = query.execute()
+        resp = await query.execute()
     except Exception as e:
         raise HTTPException(status_code=503, detail="Database unavailable") from e
     return resp.data
 
 
 @app.get("/models/{model_id:path}/history")
-def get_history(
+async def get_history(
     model_id: str,
     limit: int = Query(30, ge=1, le=180, description="Max snapshot records"),
 ):
@@ -142,9 +114,9 @@ def get_history(
     Return time-series snapshots for a specific model.
     model_id uses path param to support 'author/model-name' format.
     """
-    sb = get_supabase()
+    sb = await get_async_supabase()
     try:
-        resp = (
+        resp = await (
             sb.table("model_snapshots")
             .select("snapshot_date, downloads_30d, likes, pipeline_tag, tags")
             .eq("model_id", model_id)
@@ -160,7 +132,7 @@ def get_history(
 
 
 @app.get("/arena/rankings")
-def get_arena_rankings(
+async def get_arena_rankings(
     limit: int = Query(50, ge=1, le=200, description="Max results"),
     snapshot_date: Optional[str] = Query(None, description="Specific date (YYYY-MM-DD). Defaults to latest."),
 ):
@@ -169,12 +141,12 @@ def get_arena_rankings(
     Defaults to the latest available snapshot date.
     Source: lmarena-ai/lmarena-leaderboard HF Space (updated irregularly).
     """
-    sb = get_supabase()
+    sb = await get_async_supabase()
 
     # 指定がなければ最新の snapshot_date を使用
     if not snapshot_date:
         try:
-            latest_resp = (
+            latest_resp = await (
                 sb.table("arena_rankings")
                 .select("snapshot_date")
                 .order("snapshot_date", desc=True)
@@ -188,7 +160,7 @@ def get_arena_rankings(
         snapshot_date = latest_resp.data[0]["snapshot_date"]
 
     try:
-        resp = (
+        resp = await (
             sb.table("arena_rankings")
             .select("snapshot_date, model_name, rank, elo_score")
             .eq("snapshot_date", snapshot_date)
@@ -204,7 +176,7 @@ def get_arena_rankings(
 
 
 @app.get("/papers/recent")
-def get_recent_papers(
+async def get_recent_papers(
     category: Optional[str] = Query(None, description="Filter by arXiv category e.g. cs.AI"),
     days: int = Query(7, ge=1, le=90, description="Lookback window in days"),
     limit: int = Query(20, ge=1, le=100, description="Max results"),
@@ -214,7 +186,7 @@ def get_recent_papers(
     """
     cutoff = (date.today() - timedelta(days=days)).isoformat()
 
-    sb = get_supabase()
+    sb = await get_async_supabase()
     query = (
         sb.table("papers")
         .select("arxiv_id, title, authors, submitted_at, category, pwc_sota_flag")
@@ -226,7 +198,7 @@ def get_recent_papers(
         query = query.eq("category", category)
 
     try:
-        resp = query.execute()
+        resp = await query.execute()
     except Exception as e:
         raise HTTPException(status_code=503, detail="Database unavailable") from e
     return resp.data
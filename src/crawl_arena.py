@@ -17,7 +17,9 @@ import tempfile
 import re
 from datetime import date
 
-from huggingface_hub import hf_hub_download, list_repo_files
+import requests
+import requests_cache
+from huggingface_hub import configure_http_backend, hf_hub_download, list_repo_files
 from supabase import Client
 
 from db import get_supabase
@@ -34,6 +36,28 @@ _HF_SPACE_ID = "lmarena-ai/lmarena-leaderboard"
 _PKL_PATTERN = re.compile(r"elo_results_(\d{8})\.pkl")
 # text-full カテゴリのみ取得（テキスト会話の総合 ELO）
 _CATEGORY_PATH = ["text", "full", "leaderboard_table_df"]
+# HF Hub API レスポンスのキャッシュ（SQLite: hf_hub_cache.sqlite）
+_HF_CACHE_NAME = "hf_hub_cache"
+# Space のファイル一覧のキャッシュ秒数（一覧はほとんど変化しないため再実行時は再取得しない）
+_HF_LISTING_CACHE_EXPIRE = 3600
+
+
+def _cached_session_factory() -> requests.Session:
+    """
+    huggingface_hub 用の Session を生成する
+    キャッシュ対象は Space のファイル一覧 API のみ。pkl 本体のダウンロードはキャッシュしない
+    """
+    return requests_cache.CachedSession(
+        _HF_CACHE_NAME,
+        allowable_methods=["GET"],
+        urls_expire_after={
+            f"huggingface.co/api/spaces/{_HF_SPACE_ID}/*": _HF_LISTING_CACHE_EXPIRE,
+            "*": requests_cache.DO_NOT_CACHE,
+        },
+    )
+
+
+configure_http_backend(backend_factory=_cached_session_factory)
 
 
 def list_elo_pkl_files() -> list[tuple[str, date]]:
@@ -44,21 +68,26 @@ def list_elo_pkl_files() -> list[tuple[str, date]]:
     files = list_repo_files(_HF_SPACE_ID, repo_type="space")
     results = []
     for fname in files:
+        # Space 内の無関係なファイルは正規表現に渡す前に文字列比較で除外
+        if not fname.startswith("elo_results_") or not fname.endswith(".pkl"):
+            continue
         m = _PKL_PATTERN.match(fname)
         if m:
-            d = date(int(m.group(1)[:4]), int(m.group(1)[4:6]), int(m.group(1)[6:8]))
-            results.append((fname, d))
+            # Python 3.11 以降の fromisoformat は YYYYMMDD 形式も直接解釈できる
+            results.append((fname, date.fromisoformat(m.group(1))))
     results.sort(key=lambda x: x[1])
     return results
 
 
-def get_imported_dates(sb: Client) -> set[date]:
-    """Supabase に既にインポート済みの snapshot_date セットを返す。"""
+def get_imported_dates(sb: Client, candidates: list[date]) -> set[str]:
+    """
+    candidates のうち Supabase にインポート済みの snapshot_date（ISO 文字列）セットを返す。
+    arena_snapshot_dates ビューは 1 日付 1 行のため、候補数を超える行は返らない（1 リクエスト）
+    """
     resp = (
-        sb.table("arena_rankings")
+        sb.table("arena_snapshot_dates")
         .select("snapshot_date")
-        .order("snapshot_date", desc=True)
-        .limit(500)
+        .in_("snapshot_date", [d.isoformat() for d in candidates])
         .execute()
     )
     return {row["snapshot_date"] for row in resp.data}
@@ -91,33 +120,32 @@ def download_and_parse_pkl(filename: str, snapshot_date: date) -> list[dict]:
         logger.error(f"Unexpected pkl structure in {filename}: {e}")
         return []
 
-    rows = []
-    for model_name, row in df.iterrows():
-        rows.append({
-            "snapshot_date": snapshot_date.isoformat(),
-            "model_name": str(model_name),
-            "rank": int(row["final_ranking"]),
-            "elo_score": int(row["rating"]),
-        })
-    return rows
+    # iterrows() は行ごとに Series を生成して遅いため、必要な 2 列だけを列単位で取り出す
+    # tolist() で Python int に変換済みのため行ごとの int() 変換も不要
+    names = df.index.astype(str).tolist()
+    ranks = df["final_ranking"].to_numpy(dtype="int32").tolist()
+    ratings = df["rating"].to_numpy(dtype="int32").tolist()
+
+    iso = snapshot_date.isoformat()
+    return [
+        {"snapshot_date": iso, "model_name": name, "rank": rank, "elo_score": rating}
+        for name, rank, rating in zip(names, ranks, ratings)
+    ]
 
 
 def upsert_rankings(sb: Client, rows: list[dict]) -> tuple[int, int]:
     """
-    arena_rankings テーブルに upsert する。
+    arena_rankings テーブルに pkl 1 ファイル分をまとめて upsert する。
     戻り値: (成功件数, エラー件数)
     """
-    ok = err = 0
-    for row in rows:
-        try:
-            sb.table("arena_rankings").upsert(
-                row, on_conflict="snapshot_date,model_name"
-            ).execute()
-            ok += 1
-        except Exception as e:
-            logger.warning(f"  Failed to upsert {row['model_name']}: {e}")
-            err += 1
-    return ok, err
+    try:
+        sb.table("arena_rankings").upsert(
+            rows, on_conflict="snapshot_date,model_name"
+        ).execute()
+    except Exception as e:
+        logger.warning(f"  Failed to upsert {len(rows)} rankings: {e}")
+        return 0, len(rows)
+    return len(rows), 0
 
 
 def crawl() -> None:
@@ -131,7 +159,7 @@ def crawl() -> None:
         return
     logger.info(f"Found {len(pkl_files)} pkl files. Latest: {pkl_files[-1][0]}")
 
-    imported = get_imported_dates(sb)
+    imported = get_imported_dates(sb, [d for _, d in pkl_files])
     logger.info(f"Already imported: {len(imported)} snapshot dates")
 
     # 未インポートのファイルを新しい順に最大 3 件処理
@@ -9,10 +9,12 @@ arXiv 日次クロールスクリプト
 import sys
 import time
 import logging
-import xml.etree.ElementTree as ET
 
 import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
 from supabase import Client
+from urllib3.util.retry import Retry
 
 from config import ARXIV_CATEGORIES, PAPERS_PER_CATEGORY, ERROR_RATE_THRESHOLD
 from db import get_supabase
@@ -25,12 +27,35 @@ logger = logging.getLogger(__name__)
 
 ARXIV_API_URL = "http://export.arxiv.org/api/query"
 
+# arXiv API へのリクエスト間隔（利用規約準拠: 3秒間隔）
+_MIN_FETCH_INTERVAL_SEC = 3.0
+
+# 全カテゴリで TCP 接続を使い回し（keep-alive）、一時的なエラーは指数バックオフでリトライ
+# arXiv は 503 に Retry-After を付けて返すため、その指定にも従う（Retry の既定動作）
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
 # Atom XML 名前空間
 _NS = {
     "atom": "http://www.w3.org/2005/Atom",
     "arxiv": "http://arxiv.org/schemas/atom",
 }
 
+# エントリごとに評価する XPath はモジュールロード時に一度だけコンパイルする
+# smart_strings=False: 結果を親要素への参照を持たない素の str で受け取る
+_entry_xp = etree.XPath("/atom:feed/atom:entry", namespaces=_NS)
+_id_xp = etree.XPath("atom:id/text()", namespaces=_NS, smart_strings=False)
+_title_xp = etree.XPath("atom:title/text()", namespaces=_NS, smart_strings=False)
+_summary_xp = etree.XPath("atom:summary/text()", namespaces=_NS, smart_strings=False)
+_published_xp = etree.XPath("atom:published/text()", namespaces=_NS, smart_strings=False)
+_author_names_xp = etree.XPath("atom:author/atom:name/text()", namespaces=_NS, smart_strings=False)
+
 
 def fetch_arxiv_papers(category: str, limit: int = PAPERS_PER_CATEGORY) -> list[dict]:
     """
@@ -45,53 +70,59 @@ def fetch_arxiv_papers(category: str, limit: int = PAPERS_PER_CATEGORY) -> list[
         "max_results": limit,
     }
     try:
-        resp = requests.get(ARXIV_API_URL, params=params, timeout=30)
+        resp = _session.get(ARXIV_API_URL, params=params, timeout=30)
         resp.raise_for_status()
-        return _parse_arxiv_xml(resp.text)
+        return _parse_arxiv_xml(resp.content)
     except requests.RequestException as e:
         logger.error(f"arXiv API fetch failed for {category}: {e}")
         return []
 
 
-def _parse_arxiv_xml(xml_text: str) -> list[dict]:
+def _parse_arxiv_xml(xml_bytes: bytes) -> list[dict]:
     """Atom XML レスポンスをパースして論文リストを返す"""
-    root = ET.fromstring(xml_text)
+    root = etree.fromstring(xml_bytes)
     papers = []
-    for entry in root.findall("atom:entry", _NS):
+    for entry in _entry_xp(root):
         try:
             # http://arxiv.org/abs/2301.00234v1 → 2301.00234（バージョン番号を除去）
-            id_url = entry.find("atom:id", _NS).text
+            id_url = _id_xp(entry)[0]
             arxiv_id = id_url.split("/abs/")[-1].rsplit("v", 1)[0]
 
-            title = entry.find("atom:title", _NS).text.strip().replace("\n", " ")
-            abstract = entry.find("atom:summary", _NS).text.strip().replace("\n", " ")
-            submitted_at = entry.find("atom:published", _NS).text
+            title = _title_xp(entry)[0].strip().replace("\n", " ")
+            abstract = _summary_xp(entry)[0].strip().replace("\n", " ")
+            submitted_at = _published_xp(entry)[0]
 
-            authors = [
-                a.find("atom:name", _NS).text
-                for a in entry.findall("atom:author", _NS)
-            ]
             papers.append({
                 "arxiv_id": arxiv_id,
                 "title": title,
                 "abstract": abstract,
                 "submitted_at": submitted_at,
-                "authors": authors,
+                "authors": _author_names_xp(entry),
             })
-        except (AttributeError, TypeError) as e:
+        except IndexError as e:
             # 必須フィールド欠損のエントリは個別スキップ（他エントリへの影響なし）
             logger.warning(f"Skipping malformed entry: {e}")
     return papers
 
 
-def upsert_paper(sb: Client, paper: dict) -> None:
+def _throttle(last_fetch_time: float | None, min_interval: float = _MIN_FETCH_INTERVAL_SEC) -> None:
+    """
+    前回のリクエスト完了から min_interval 秒経過するまで待つ
+    間に行った upsert の処理時間も待ち時間に含めるため、固定 sleep より待機が短くなる
     """
-    papers テーブルに upsert する
+    if last_fetch_time is None:
+        return
+    time.sleep(max(0.0, last_fetch_time + min_interval - time.monotonic()))
+
+
+def upsert_papers(sb: Client, papers: list[dict]) -> None:
+    """
+    papers テーブルに一括 upsert する
     同一 arxiv_id は全フィールドを上書き（category 等の後付けカラムを更新するため）
     pwc_sota_flag は別バッチ（PapersWithCode 連携）で付与
     """
     sb.table("papers").upsert(
-        paper,
+        papers,
         on_conflict="arxiv_id",
     ).execute()
 
@@ -102,22 +133,29 @@ def crawl(categories: list[str] = ARXIV_CATEGORIES) -> None:
     total_papers = 0
     total_errors = 0
 
+    last_fetch_time = None
+
     for category in categories:
+        # arXiv API へのレート制限対策（前回リクエストからの経過時間で待機）
+        _throttle(last_fetch_time)
         logger.info(f"Fetching category={category} ...")
         papers = fetch_arxiv_papers(category)
+        last_fetch_time = time.monotonic()
         logger.info(f"  Got {len(papers)} papers")
 
         for paper in papers:
+            paper["category"] = category  # クロール元カテゴリを付与
+        # 同一バッチ内に同じ arxiv_id があると ON CONFLICT が同じ行を二度更新しエラーになるため除去
+        papers = list({paper["arxiv_id"]: paper for paper in papers}.values())
+
+        # カテゴリ単位で 1 リクエストにまとめて upsert（論文ごとの HTTP 往復を避ける）
+        if papers:
             try:
-                paper["category"] = category  # クロール元カテゴリを付与
-                upsert_paper(sb, paper)
-                total_papers += 1
+                upsert_papers(sb, papers)
+                total_papers += len(papers)
             except Exception as e:
-                logger.warning(f"  Failed to upsert {paper.get('arxiv_id')}: {e}")
-                total_errors += 1
-
-        # arXiv API へのレート制限対策（利用規約準拠: 3秒間隔）
-        time.sleep(3)
+                logger.warning(f"  Failed to upsert {len(papers)} papers for category={category}: {e}")
+                total_errors += len(papers)
 
     total_processed = total_papers + total_errors
     error_rate = total_errors / total_processed if total_processed > 0 else 0.0
@@ -6,16 +6,17 @@ HF Models API 日次クロールスクリプト
 保存先: Supabase (環境変数 SUPABASE_URL / SUPABASE_KEY)
 """
 
+import asyncio
 import sys
-import time
 import logging
 from datetime import date
 
-import requests
+import httpx
 from supabase import Client
 
 from config import TARGET_PIPELINE_TAGS, LIMIT_PER_TAG, ERROR_RATE_THRESHOLD
 from db import get_supabase
+from response_cache import clear_models_cache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,8 +26,19 @@ logger = logging.getLogger(__name__)
 
 HF_API_BASE = "https://huggingface.co/api"
 
+# HF API への同時リクエスト数の上限（HF APIへの配慮）
+_FETCH_CONCURRENCY = 3
+# 1リクエスト完了後に同時実行枠を保持する秒数（簡易レート制限）
+_FETCH_INTERVAL_SEC = 0.3
+# 一時的なエラー（接続失敗 / 429 / 5xx）時のリトライ回数と指数バックオフの基準秒数
+_RETRY_TOTAL = 3
+_RETRY_BACKOFF_SEC = 0.5
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def fetch_hf_models(pipeline_tag: str, limit: int = LIMIT_PER_TAG) -> list[dict]:
+
+async def fetch_hf_models(
+    client: httpx.AsyncClient, pipeline_tag: str, limit: int = LIMIT_PER_TAG
+) -> list[dict]:
     """
     HF Models API からモデル一覧を取得する
     ソート: likes 降順（人気度順）
@@ -40,89 +52,173 @@ def fetch_hf_models(pipeline_tag: str, limit: int = LIMIT_PER_TAG) -> list[dict]
         "full": False,
     }
     url = f"{HF_API_BASE}/models"
-    try:
-        resp = requests.get(url, params=params, timeout=30)
-        resp.raise_for_status()
-        return resp.json()
-    except requests.RequestException as e:
-        logger.error(f"HF API fetch failed for {pipeline_tag}: {e}")
-        return []
+    for attempt in range(_RETRY_TOTAL + 1):
+        try:
+            resp = await client.get(url, params=params)
+            resp.raise_for_status()
+            return resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: 200 でも本文が JSON でない場合（json.JSONDecodeError）。リトライしない
+            retryable = isinstance(e, httpx.TransportError) or (
+                isinstance(e, httpx.HTTPStatusError)
+                and e.response.status_code in _RETRY_STATUSES
+            )
+            if not retryable or attempt == _RETRY_TOTAL:
+                logger.error(f"HF API fetch failed for {pipeline_tag}: {e}")
+                return []
+            await asyncio.sleep(_RETRY_BACKOFF_SEC * 2 ** attempt)
+
+
+async def fetch_all_tags(pipeline_tags: list[str]) -> list[list[dict]]:
+    """
+    全タグのモデル一覧を並行取得する（タグごとの取得は互いに独立）
+    戻り値は pipeline_tags と同じ順序
+    """
+    semaphore = asyncio.Semaphore(_FETCH_CONCURRENCY)
+
+    # 全タグで TCP/TLS 接続を使い回す（keep-alive）
+    limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        async def fetch(tag: str) -> list[dict]:
+            async with semaphore:
+                logger.info(f"Fetching tag={tag} ...")
+                models = await fetch_hf_models(client, tag)
+                await asyncio.sleep(_FETCH_INTERVAL_SEC)
+                return models
+
+        # 1 タグの想定外の例外で他タグの結果を失わないよう、例外は結果として受け取る
+        results = await asyncio.gather(
+            *(fetch(tag) for tag in pipeline_tags), return_exceptions=True
+        )
 
+    models_per_tag = []
+    for tag, result in zip(pipeline_tags, results):
+        if isinstance(result, BaseException):
+            logger.error(f"HF API fetch failed for {tag}: {result!r}")
+            result = []
+        models_per_tag.append(result)
+    return models_per_tag
+
+
+def build_model_row(model: dict) -> dict | None:
+    """HF API のレスポンス 1 件からモデルマスタの行を組み立てる（model_id 欠損時は None）"""
+    model_id = model.get("modelId") or model.get("id")
+    if not model_id:
+        return None
+
+    # "author/name" の分割は 1 回だけ行う（author なしの ID はそのまま name になる）
+    author, sep, name = model_id.rpartition("/")
+    return {
+        "id": model_id,
+        "name": name,
+        "author": author.split("/")[0] if sep else None,
+        "pipeline_tag": model.get("pipeline_tag"),
+    }
 
-def upsert_model(sb: Client, model: dict) -> None:
+
+def build_snapshot_row(model: dict, snapshot_date: str) -> dict | None:
     """
-    モデルマスタに upsert する（既存なら author/pipeline_tag を更新しない）
+    HF API のレスポンス 1 件からスナップショット行を組み立てる（model_id 欠損時は None）
+    snapshot_date は ISO 形式の文字列（モデルごとに isoformat() しないよう呼び出し側で 1 回だけ変換）
     """
     model_id = model.get("modelId") or model.get("id")
     if not model_id:
-        return
+        return None
+
+    downloads = model.get("downloads")         # None の場合あり
+    likes = model.get("likes", 0)
+    pipeline_tag = model.get("pipeline_tag")
+    tags = model.get("tags", [])
+
+    return {
+        "model_id": model_id,
+        "snapshot_date": snapshot_date,
+        "downloads_30d": downloads,
+        "likes": likes,
+        "pipeline_tag": pipeline_tag,
+        "tags": tags,
+        # business_score / business_summary は別バッチ（LLM処理）で付与
+    }
+
 
-    author = model_id.split("/")[0] if "/" in model_id else None
+def upsert_models(sb: Client, rows: list[dict]) -> None:
+    """
+    モデルマスタに一括 upsert する（既存なら author/pipeline_tag を更新しない）
+    """
     sb.table("models").upsert(
-        {
-            "id": model_id,
-            "name": model_id.split("/")[-1] if "/" in model_id else model_id,
-            "author": author,
-            "pipeline_tag": model.get("pipeline_tag"),
-        },
+        rows,
         on_conflict="id",
         ignore_duplicates=True,  # 初回登録のみ。更新は snapshot 側で管理
     ).execute()
 
 
-def upsert_snapshot(sb: Client, model: dict, today: date) -> None:
+def upsert_snapshots(sb: Client, rows: list[dict]) -> None:
     """
-    今日分の日次スナップショットを upsert する
+    今日分の日次スナップショットを一括 upsert する
     同日の重複実行は上書き（UNIQUE制約でupsert）
     """
-    model_id = model.get("modelId") or model.get("id")
-    if not model_id:
-        return
-
-    downloads = model.get("downloads")         # None の場合あり
-    likes = model.get("likes", 0)
-    tags = model.get("tags", [])
-
     sb.table("model_snapshots").upsert(
-        {
-            "model_id": model_id,
-            "snapshot_date": today.isoformat(),
-            "downloads_30d": downloads,
-            "likes": likes,
-            "pipeline_tag": model.get("pipeline_tag"),
-            "tags": tags,
-            # business_score / business_summary は別バッチ（LLM処理）で付与
-        },
+        rows,
         on_conflict="model_id,snapshot_date",
     ).execute()
 
 
+def fetch_snapshotted_model_ids(sb: Client, today: date) -> set[str]:
+    """
+    今日分のスナップショットが書き込み済みの model_id セットを返す（部分失敗後の再実行用）
+    PostgREST の max-rows で切り詰められた場合も、漏れた分は upsert し直すだけで整合性は保たれる
+    """
+    resp = (
+        sb.table("model_snapshots")
+        .select("model_id")
+        .eq("snapshot_date", today.isoformat())
+        .execute()
+    )
+    return {row["model_id"] for row in resp.data}
+
+
 def crawl(pipeline_tags: list[str] = TARGET_PIPELINE_TAGS) -> None:
     """
     メイン処理: 全タグを走査してSupabaseに保存
     """
     sb = get_supabase()
     today = date.today()
+    today_iso = today.isoformat()
     total_models = 0
     total_errors = 0
 
-    for tag in pipeline_tags:
-        logger.info(f"Fetching tag={tag} ...")
-        models = fetch_hf_models(tag)
-        logger.info(f"  Got {len(models)} models")
-
-        for model in models:
+    # 同日の再実行では書き込み済みのモデルを upsert 対象から除外する
+    try:
+        done_today = fetch_snapshotted_model_ids(sb, today)
+    except Exception as e:
+        logger.warning(f"Failed to fetch today's snapshots, upserting all models: {e}")
+        done_today = set()
+    if done_today:
+        logger.info(f"Already snapshotted today: {len(done_today)} models")
+
+    results = asyncio.run(fetch_all_tags(pipeline_tags))
+
+    for tag, models in zip(pipeline_tags, results):
+        logger.info(f"tag={tag}: got {len(models)} models")
+
+        # タグ単位で 1 リクエストにまとめて upsert（モデルごとの HTTP 往復を避ける）
+        model_rows = [
+            row for row in (build_model_row(m) for m in models)
+            if row and row["id"] not in done_today
+        ]
+        snapshot_rows = [
+            row for row in (build_snapshot_row(m, today_iso) for m in models)
+            if row and row["model_id"] not in done_today
+        ]
+        if snapshot_rows:
             try:
-                upsert_model(sb, model)
-                upsert_snapshot(sb, model, today)
-                total_models += 1
+                # model_snapshots.model_id は models.id を参照するためモデルマスタを先に登録
+                upsert_models(sb, model_rows)
+                upsert_snapshots(sb, snapshot_rows)
+                total_models += len(snapshot_rows)
             except Exception as e:
-                model_id = model.get("modelId") or model.get("id", "unknown")
-                logger.warning(f"  Failed to upsert {model_id}: {e}")
-                total_errors += 1
-
-        # タグ間に短いインターバル（HF APIへの配慮）
-        time.sleep(1)
+                logger.warning(f"  Failed to upsert {len(snapshot_rows)} models for tag={tag}: {e}")
+                total_errors += len(snapshot_rows)
 
     total_processed = total_models + total_errors
     error_rate = total_errors / total_processed if total_processed > 0 else 0.0
@@ -132,6 +228,12 @@ def crawl(pipeline_tags: list[str] = TARGET_PIPELINE_TAGS) -> None:
         f"error_rate={error_rate:.1%}"
     )
 
+    # 新しいスナップショットを API に反映させるため /models/* のレスポンスキャッシュを破棄
+    try:
+        asyncio.run(clear_models_cache())
+    except Exception as e:
+        logger.warning(f"Failed to clear API response cache: {e}")
+
     # エラー率が閾値を超えた場合は非ゼロ終了して GitHub Actions にアラートを出す
     if error_rate > ERROR_RATE_THRESHOLD:
         logger.error(
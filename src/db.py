@@ -1,25 +1,55 @@
 """
 Supabase クライアントファクトリ
 api.py / crawl_hf.py の両方から参照する共通モジュール
+
+api.py はイベントループ上で DB 待ちを多重化するため AsyncClient を、
+クロールスクリプトは同期実行のため Client を使う
 """
 
+import asyncio
 import os
-import threading
+from functools import cache
+
+from supabase import (
+    acreate_client,
+    create_client,
+    AsyncClient,
+    AsyncClientOptions,
+    Client,
+    ClientOptions,
+)
 
-from supabase import create_client, Client
+# PostgREST へのリクエストタイムアウト（秒）
+# 応答しないリクエストが接続プールを占有し続けるのを防ぐ
+_POSTGREST_TIMEOUT_SEC = 10
 
-# モジュールレベルでキャッシュし、リクエストごとに新規接続を生成しない
-_client: Client | None = None
-# 複数スレッドからの同時初期化を防ぐロック
-_client_lock = threading.Lock()
+# AsyncClient はモジュールレベルでキャッシュし、リクエストごとに新規接続を生成しない
+# （コルーチン関数は functools.cache で結果をキャッシュできないため明示的に保持する）
+_async_client: AsyncClient | None = None
+# 同一イベントループ上の複数リクエストからの同時初期化を防ぐロック
+_async_client_lock = asyncio.Lock()
 
 
+# 初回呼び出しで生成した Client を以降も返す
+# 同時の初回呼び出しでは生成が重複し得るが（後勝ちでキャッシュ）、
+# 呼び出し元はシングルスレッドのクロールスクリプトのみのためロックは不要
+@cache
 def get_supabase() -> Client:
-    global _client
-    if _client is None:          # 初期化後はロック不要（高速パス）
-        with _client_lock:
-            if _client is None:  # ロック後に再確認（double-checked locking）
+    url = os.environ["SUPABASE_URL"]
+    key = os.environ["SUPABASE_KEY"]
+    return create_client(
+        url, key, options=ClientOptions(postgrest_client_timeout=_POSTGREST_TIMEOUT_SEC)
+    )
+
+
+async def get_async_supabase() -> AsyncClient:
+    global _async_client
+    if _async_client is None:
+        async with _async_client_lock:
+            if _async_client is None:  # await 中に他リクエストが初期化済みの場合がある
                 url = os.environ["SUPABASE_URL"]
                 key = os.environ["SUPABASE_KEY"]
-                _client = create_client(url, key)
-    return _client
+                _async_client = await acreate_client(
+                    url, key, options=AsyncClientOptions(postgrest_client_timeout=_POSTGREST_TIMEOUT_SEC)
+                )
+    return _async_client
@@ -0,0 +1,80 @@
+"""
+API レスポンスキャッシュ（fastapi-cache2 + Redis）
+api.py / crawl_hf.py の両方から参照する共通モジュール
+
+スナップショットは日次クロールでしか更新されないため、
+集計系エンドポイントのレスポンスを Redis にキャッシュし、クロール完了時に破棄する
+"""
+
+import hashlib
+import os
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi_cache import FastAPICache
+from fastapi_cache.coder import Coder
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+
+# Redis キーのプレフィックス（同一 Redis を他サービスと共有しても衝突しない）
+CACHE_PREFIX = "aimt"
+# /models/* のキャッシュ名前空間（crawl_hf.py 完了時にまとめて破棄する単位）
+MODELS_NAMESPACE = "models"
+# キャッシュ TTL（秒）。日次クロール後は明示的に破棄するため短めで十分
+MODELS_CACHE_EXPIRE = 3600
+
+
+class ORJsonCoder(Coder):
+    """キャッシュ値の (de)serialize を orjson で行う（レスポンス本体と同じエンコーダ）"""
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+
+def init_cache() -> None:
+    """
+    FastAPICache を初期化する
+    REDIS_URL 未設定（ローカル開発）の場合はプロセス内メモリにフォールバック
+    """
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        backend = RedisBackend(aioredis.from_url(redis_url))
+    else:
+        backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix=CACHE_PREFIX, coder=ORJsonCoder)
+
+
+def query_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Any = None,
+    response: Any = None,
+    args: tuple = (),
+    kwargs: Optional[dict] = None,
+) -> str:
+    """(pipeline_tag, days, limit) のハッシュをキーにする（エンドポイント名で区別）"""
+    kwargs = kwargs or {}
+    params = (kwargs.get("pipeline_tag"), kwargs.get("days"), kwargs.get("limit"))
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f"{namespace}:{func.__name__}:{digest}"
+
+
+async def clear_models_cache() -> None:
+    """
+    /models/* のキャッシュを破棄する（crawl_hf.py のクロール完了時に呼ぶ）
+    REDIS_URL 未設定の場合は共有キャッシュが存在しないため何もしない
+    """
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return
+    # グローバルな FastAPICache は初期化せず、バックエンドを直接使って破棄する
+    # キー形式は @cache(namespace=MODELS_NAMESPACE) が生成する "{prefix}:{namespace}:..." に合わせる
+    async with aioredis.from_url(redis_url) as redis:
+        await RedisBackend(redis).clear(f"{CACHE_PREFIX}:{MODELS_NAMESPACE}")